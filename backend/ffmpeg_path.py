@@ -0,0 +1,60 @@
+import os
+import subprocess
+
+# audio_separator requires ffmpeg on PATH. On Windows, WinGet installs
+# ffmpeg to a directory that may not be inherited by child processes.
+FFMPEG_SEARCH_DIRS = [
+    os.path.join(os.environ.get("LOCALAPPDATA", ""), "Microsoft", "WinGet", "Links"),
+    os.path.join(os.environ.get("LOCALAPPDATA", ""), "Microsoft", "WinGet", "Packages"),
+    os.path.join(os.environ.get("ProgramFiles", ""), "ffmpeg", "bin"),
+    os.path.join(os.environ.get("ProgramFiles(x86)", ""), "ffmpeg", "bin"),
+]
+
+# The directory found by the search is remembered here, so later launches
+# skip both the `ffmpeg -version` probe and the directory listings.
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ffmpeg_path")
+
+# Set once ffmpeg is known to be reachable; inherited by worker subprocesses
+FFMPEG_OK_ENV = "UNWEAVE_FFMPEG_OK"
+
+
+def _add_to_path(ffmpeg_dir: str):
+    os.environ["PATH"] = ffmpeg_dir + os.pathsep + os.environ.get("PATH", "")
+    os.environ[FFMPEG_OK_ENV] = "1"
+
+
+def ensure_ffmpeg_on_path() -> str | None:
+    """
+    Makes sure ffmpeg is reachable through PATH.
+    Returns the directory that was prepended to PATH, "" if nothing had to
+    change, or None if ffmpeg could not be found.
+    """
+    if os.environ.get(FFMPEG_OK_ENV) == "1":
+        return ""
+
+    try:
+        with open(CACHE_FILE, encoding="utf-8") as f:
+            cached_dir = f.read().strip()
+        if cached_dir and os.path.isdir(cached_dir):
+            _add_to_path(cached_dir)
+            return cached_dir
+    except OSError:
+        pass
+
+    try:
+        subprocess.check_output(["ffmpeg", "-version"], stderr=subprocess.DEVNULL)
+        os.environ[FFMPEG_OK_ENV] = "1"
+        return ""
+    except FileNotFoundError:
+        pass
+
+    for ffmpeg_dir in FFMPEG_SEARCH_DIRS:
+        if os.path.isdir(ffmpeg_dir) and any(f.lower().startswith("ffmpeg") for f in os.listdir(ffmpeg_dir)):
+            try:
+                with open(CACHE_FILE, "w", encoding="utf-8") as f:
+                    f.write(ffmpeg_dir)
+            except OSError:
+                pass  # read-only install dir; we just probe again next launch
+            _add_to_path(ffmpeg_dir)
+            return ffmpeg_dir
+    return None
@@ -1,19 +1,40 @@
 import os
+
+# Must be set before torch is imported. Lets the CUDA caching allocator grow
+# segments in place instead of fragmenting across jobs of different lengths.
+# Inherited by the worker subprocess.
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True,max_split_size_mb:512")
+
 import sys
 import io
 import re
 import shutil
-import uuid
+import secrets
 import time
 import threading
 import logging
 import subprocess
-
+import signal
+import json
+import functools
+import heapq
+from contextlib import asynccontextmanager
+import codecs
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict, replace
+from typing import BinaryIO
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
 from fastapi import FastAPI, File, UploadFile, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, FileResponse
+
+from warmup import warmup
+from ffmpeg_path import ensure_ffmpeg_on_path
+from prewarm import mirror_models
 
 # ============================================================
 # Logging
@@ -112,26 +133,14 @@ if GPU_VRAM_GB:
 # ============================================================
 # FFmpeg PATH Fix (Windows)
 # ============================================================
-# audio_separator requires ffmpeg on PATH. On Windows, WinGet installs
-# ffmpeg to a directory that may not be inherited by child processes.
+# Windows only: WinGet installs ffmpeg outside the inherited PATH. The result
+# is exported to the environment, so worker processes skip the lookup.
 if sys.platform == "win32":
-    try:
-        import subprocess as _sp
-        _sp.check_output(["ffmpeg", "-version"], stderr=_sp.DEVNULL)
-    except FileNotFoundError:
-        _ffmpeg_search_dirs = [
-            os.path.join(os.environ.get("LOCALAPPDATA", ""), "Microsoft", "WinGet", "Links"),
-            os.path.join(os.environ.get("LOCALAPPDATA", ""), "Microsoft", "WinGet", "Packages"),
-            os.path.join(os.environ.get("ProgramFiles", ""), "ffmpeg", "bin"),
-            os.path.join(os.environ.get("ProgramFiles(x86)", ""), "ffmpeg", "bin"),
-        ]
-        for _dir in _ffmpeg_search_dirs:
-            if os.path.isdir(_dir) and any(f.lower().startswith("ffmpeg") for f in os.listdir(_dir)):
-                os.environ["PATH"] = _dir + os.pathsep + os.environ.get("PATH", "")
-                log.info(f"🔧 Added ffmpeg to PATH from: {_dir}")
-                break
-        else:
-            log.warning("⚠️  ffmpeg not found on PATH. Audio separation may fail.")
+    _ffmpeg_dir = ensure_ffmpeg_on_path()
+    if _ffmpeg_dir:
+        log.info(f"🔧 Added ffmpeg to PATH from: {_ffmpeg_dir}")
+    elif _ffmpeg_dir is None:
+        log.warning("⚠️  ffmpeg not found on PATH. Audio separation may fail.")
 
 # ============================================================
 # Configuration
@@ -140,18 +149,104 @@ CLOUD_MODE = os.getenv("CLOUD_MODE", "false").lower() == "true"
 MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "50"))
 CLEANUP_INTERVAL = int(os.getenv("CLEANUP_INTERVAL_SECONDS", "3600"))
 RETENTION_SECONDS = 1800 if CLOUD_MODE else CLEANUP_INTERVAL
+# Separations that may run at once. Each one gets its own long-lived worker
+# process with its own copy of the model; one per GPU keeps VRAM predictable.
+# Workers are assigned to GPUs round-robin (see GPU_IDS).
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "1"))
+# GPUs the worker pool is spread over, round-robin. Each worker only sees its
+# own GPU (as cuda:0), so it never creates a stray context on another card.
+if DEVICE_TYPE == "cuda":
+    _visible_gpus = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if _visible_gpus:
+        GPU_IDS = [g.strip() for g in _visible_gpus.split(",") if g.strip()]
+    else:
+        GPU_IDS = [str(i) for i in range(torch.cuda.device_count())]
+else:
+    GPU_IDS = []
+# Upper bound on tracked jobs; the oldest finished ones are dropped first
+MAX_JOBS = int(os.getenv("MAX_JOBS", "1000"))
+# CPU threads per worker. os.cpu_count() reports the host's cores inside
+# containers, so default low and let TORCH_NUM_THREADS raise it. OpenMP in the
+# worker gets the same cap so concurrent jobs don't oversubscribe the CPU.
+if DEVICE_TYPE == "cpu":
+    os.environ.setdefault("OMP_NUM_THREADS", os.getenv("TORCH_NUM_THREADS", "2"))
 
 # ============================================================
 # App Setup
 # ============================================================
+class ORJSONResponse(JSONResponse):
+    """JSON responses encoded with orjson; /status is polled about once a second per job.
+
+    (fastapi.responses.ORJSONResponse does the same but is deprecated upstream.)
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Workers load the model from a RAM copy in /dev/shm when one fits. Made
+    # here rather than at import, so importing main.py copies nothing.
+    WORKER_CMD[-1] = await asyncio.to_thread(mirror_models, MODELS_DIR, MODEL_FILE)
+    await warmup(worker_pool)
+    yield
+    # Workers and transcodes run in their own sessions, so Ctrl+C or a
+    # --reload never reaches them; stop them here instead of leaving a busy
+    # worker holding VRAM after the server is gone
+    with processes_lock:
+        transcodes = list(active_transcodes.values())
+    for transcode in transcodes:
+        kill_process_group(transcode)
+    await asyncio.to_thread(worker_pool.shutdown)
+
+
 app = FastAPI(
     title="Unweave API",
     description="AI-powered audio stem separation",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 app.add_middleware(ProxyHeadersMiddleware, trusted_hosts=["*"])
 
+
+class UploadSizeLimitMiddleware:
+    """Rejects an upload whose Content-Length is already over the upload limit.
+
+    Runs before the multipart body is read, so an oversized upload is
+    turned away without being received and spooled to disk first. Only
+    POSTs to the given upload paths are checked; other routes aren't capped.
+    """
+
+    # Room for the multipart boundaries and part headers around the file
+    MULTIPART_OVERHEAD = 64 * 1024
+
+    def __init__(self, app, max_bytes: int, paths: frozenset[str]):
+        self.app = app
+        self.max_bytes = max_bytes + self.MULTIPART_OVERHEAD
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in self.paths:
+            length = dict(scope["headers"]).get(b"content-length", b"")
+            if length.isdigit() and int(length) > self.max_bytes:
+                response = ORJSONResponse(
+                    {"error": f"File too large ({int(length) / (1024 * 1024):.1f} MB). Max: {MAX_FILE_SIZE_MB} MB"},
+                    status_code=413,
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_bytes=MAX_FILE_SIZE_MB * 1024 * 1024,
+    paths=frozenset({"/separate/"}),
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -179,221 +274,594 @@ else:
     OUTPUT_DIR = os.path.join(BASE_DIR, "static_stems")
 
 MODELS_DIR = os.path.join(BASE_DIR, "models")
+# The model worker.py loads (its MODEL_FILE)
+MODEL_FILE = "htdemucs_6s.yaml"
 
 os.makedirs(TEMP_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(MODELS_DIR, exist_ok=True)
 
-app.mount("/stems", StaticFiles(directory=OUTPUT_DIR), name="stems")
+# Resolved once so stem paths can be checked against it (e.g. /tmp is a symlink on macOS)
+STEMS_ROOT = os.path.realpath(OUTPUT_DIR)
+TEMP_ROOT = os.path.realpath(TEMP_DIR)
+
 
 # ============================================================
 # Job Progress Tracking
 # ============================================================
-# Stores progress for active jobs:
-# { job_id: { "status": "uploading|processing|complete|error|cancelled",
-#             "progress": 0-100, "eta_seconds": float,
-#             "message": str, "stems": dict, "started_at": float,
-#             "processing_time": float, "device_used": str } }
-jobs: dict = {}
-jobs_lock = threading.Lock()
+@dataclass(frozen=True, slots=True)
+class Job:
+    """Progress and result of one separation job.
+
+    Immutable: updates swap in a new Job, so readers can use whatever instance
+    they got without a lock or a copy.
+    """
+    status: str  # queued | processing | complete | error | cancelled
+    progress: int = 0  # 0-100
+    eta_seconds: int | None = None
+    message: str = ""
+    stems: dict | None = None
+    started_at: float = 0.0
+    processing_time: float | None = None
+    device_used: str = ""
+    # Files this job has written so far; lets a cancel unlink them instead of
+    # walking the dirs. Server-side only, not part of /status.
+    files: tuple[str, ...] | None = field(default=None, repr=False)
+
+
+# The job table is split into lock-striped shards so /status polls, progress
+# updates and the cleanup thread only contend when they hit the same shard.
+JOB_SHARDS = 16  # power of two; see _shard()
+_job_shards: list[tuple[threading.Lock, OrderedDict[str, Job]]] = [
+    (threading.Lock(), OrderedDict()) for _ in range(JOB_SHARDS)
+]
+# MAX_JOBS is enforced per shard
+_max_jobs_per_shard = max(1, -(-MAX_JOBS // JOB_SHARDS))
+
+
+def _shard(job_id: str) -> tuple[threading.Lock, OrderedDict[str, Job]]:
+    return _job_shards[hash(job_id) & (JOB_SHARDS - 1)]
+
 
 # Track active subprocesses so they can be securely terminated on cancel
 active_processes: dict = {}
+# ffmpeg transcodes in flight, by job (asyncio Process or Popen)
+active_transcodes: dict = {}
 processes_lock = threading.Lock()
 
 
-def update_job(job_id: str, **kwargs):
-    with jobs_lock:
-        if job_id in jobs:
-            jobs[job_id].update(kwargs)
+# Job IDs are secrets.token_hex(8): 16 lowercase hex chars (64 bits). Earlier
+# versions issued uuid4 strings; those are still accepted so stems left on disk
+# by them can be served until they expire.
+_JOB_ID_RE = re.compile(r"[0-9a-f]{16}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
 
+def new_job_id() -> str:
+    return secrets.token_hex(8)
 
-def get_job(job_id: str) -> dict | None:
-    with jobs_lock:
-        return jobs.get(job_id, {}).copy() if job_id in jobs else None
+
+def is_valid_job_id(job_id: str) -> bool:
+    """Job IDs end up in file paths; anything else is rejected before use."""
+    return _JOB_ID_RE.fullmatch(job_id) is not None
+
+
+def add_job(job_id: str, job: Job):
+    lock, shard = _shard(job_id)
+    with lock:
+        shard[job_id] = job
+        evict_old_jobs(shard)
+
+
+def update_job(job_id: str, **kwargs):
+    # The lock only serializes writers (so concurrent updates aren't lost);
+    # the new Job is published with a single dict assignment
+    lock, shard = _shard(job_id)
+    with lock:
+        job = shard.get(job_id)
+        if job:
+            shard[job_id] = replace(job, **kwargs)
+
+
+def get_job(job_id: str) -> Job | None:
+    # A single dict lookup is atomic and Jobs are never mutated, so /status
+    # polls don't take the shard lock at all
+    if not is_valid_job_id(job_id):
+        return None
+    return _shard(job_id)[1].get(job_id)
+
+
+def all_jobs() -> list[tuple[str, Job]]:
+    """Snapshot of every job, oldest first. Takes each shard lock in turn."""
+    snapshot = []
+    for lock, shard in _job_shards:
+        with lock:
+            snapshot.extend(shard.items())
+    snapshot.sort(key=lambda item: item[1].started_at)
+    return snapshot
+
+
+def expire_job(job_id: str) -> tuple[bool, tuple[str, ...] | None]:
+    """Drops a finished job from the table.
+
+    Returns whether its stems dir should be removed, and the stem files
+    recorded for it (None if the job isn't tracked).
+    """
+    lock, shard = _shard(job_id)
+    with lock:
+        job = shard.get(job_id)
+        if job is None:
+            return True, None  # evicted, or left over from a previous run
+        if job.status in ("complete", "error"):
+            del shard[job_id]
+            return True, job.files
+        return False, None
+
+
+def evict_old_jobs(shard: OrderedDict[str, Job]):
+    """Drops the oldest finished jobs beyond the shard's share of MAX_JOBS. Caller must hold the shard lock."""
+    excess = len(shard) - _max_jobs_per_shard
+    if excess <= 0:
+        return
+    # Oldest first; queued/running jobs are pinned. Pick victims from one
+    # items() snapshot, then delete in a second pass.
+    evicted = []
+    for jid, job in list(shard.items()):
+        if job.status in ("queued", "processing"):
+            continue
+        evicted.append(jid)
+        if len(evicted) >= excess:
+            break
+    for jid in evicted:
+        del shard[jid]
 
 
 # ============================================================
 # Parse Tqdm from Subprocess
 # ============================================================
-def parse_tqdm_line(line: str, job_id: str, is_downloading: bool = False):
-    """Extracts progress percentage + ETA from a tqdm stderr line and updates the job."""
-    progress_pattern = re.compile(r'(\d+)%\|')
-    eta_pattern = re.compile(r'<(\d+):(\d+)')
+_PROGRESS_RE = re.compile(r'(\d+)%\|')
+_ETA_RE = re.compile(r'<(\d+):(\d+)')
 
-    progress_match = progress_pattern.search(line)
-    if progress_match:
-        pct = int(progress_match.group(1))
-        eta_seconds = None
 
-        eta_match = eta_pattern.search(line)
-        if eta_match:
-            minutes = int(eta_match.group(1))
-            seconds = int(eta_match.group(2))
-            eta_seconds = minutes * 60 + seconds
+def parse_tqdm_line(line: str) -> tuple[int, int | None] | None:
+    """Extracts progress percentage + ETA (in seconds) from a tqdm stderr line."""
+    progress_match = _PROGRESS_RE.search(line)
+    if not progress_match:
+        return None
 
-        msg = f"Downloading model... {pct}%" if is_downloading else f"Separating stems... {pct}%"
+    pct = int(progress_match.group(1))
+    eta_seconds = None
 
-        update_job(
-            job_id,
-            progress=pct,
-            eta_seconds=eta_seconds,
-            message=msg,
-        )
+    eta_match = _ETA_RE.search(line)
+    if eta_match:
+        minutes = int(eta_match.group(1))
+        seconds = int(eta_match.group(2))
+        eta_seconds = minutes * 60 + seconds
+
+    return pct, eta_seconds
 
 
 # ============================================================
-# Separation Worker (Subprocess Managed)
+# Stem Labels
 # ============================================================
-def run_separation(job_id: str, input_path: str, job_out_dir: str, job_temp_dir: str):
-    """Spawns the worker.py script as a subprocess to perform separation."""
-    try:
-        update_job(job_id, status="processing", progress=0, message="Initializing worker...")
-        start_time = time.time()
-
-        worker_script = os.path.join(BASE_DIR, "worker.py")
-        cmd = [
-            sys.executable,
-            worker_script,
-            "--job_id", job_id,
-            "--input", input_path,
-            "--out_dir", job_out_dir,
-            "--device_type", DEVICE_TYPE,
-            "--models_dir", MODELS_DIR
-        ]
+STEM_KEYWORDS = (
+    ("vocals", "Vocals"),
+    ("drums", "Drums"),
+    ("bass", "Bass"),
+    ("guitar", "Guitar"),
+    ("piano", "Piano"),
+    ("other", "Other"),
+)
+
+
+def label_for(name: str) -> str | None:
+    """Maps a stem file name like 'song_(Vocals)_htdemucs_6s.mp3' to its stem label."""
+    # audio_separator names outputs "<input>_(<Stem>)_<model>.<ext>"; match on
+    # the tag when present so words in the song title can't pick the label.
+    _, sep, tail = name.rpartition("_(")
+    lname = (tail.partition(")")[0] if sep else name).lower()
+    for keyword, label in STEM_KEYWORDS:
+        if keyword in lname:
+            return label
+    return None
+
+
+# ============================================================
+# Separation Worker (Long-lived Subprocess)
+# ============================================================
+_STDERR_LINE_RE = re.compile(r'[\r\n]')
+
+# Device and paths are fixed at startup, so the worker command line is too.
+# The lifespan repoints --models_dir (the last entry) at the /dev/shm copy of
+# the model, if one is made, before any worker starts.
+WORKER_CMD = [
+    sys.executable,
+    os.path.join(BASE_DIR, "worker.py"),
+    "--device_type", DEVICE_TYPE,
+    "--models_dir", MODELS_DIR
+]
+
+
+class SeparationWorker:
+    """Keeps one worker.py subprocess alive so its model is only loaded once.
+
+    Jobs are sent to the worker one at a time over stdin; the worker streams
+    tqdm progress on stderr and answers each job with a DONE:/ERROR: line on
+    stdout. If the process dies (e.g. it was killed by a cancel), the next job
+    starts a fresh one.
+
+    Each worker process has one reader thread per pipe. Jobs themselves are
+    coroutines that await the reader's answer, so an in-flight job doesn't
+    hold a thread. (Plain Popen rather than asyncio subprocesses: uvicorn
+    runs a selector loop on Windows under --reload, which can't spawn them.)
+    """
+
+    def __init__(self, name: str = "Worker", gpu_id: str | None = None):
+        self.name = name  # log prefix
+        self.gpu_id = gpu_id  # CUDA_VISIBLE_DEVICES for the process, if pinned
+        self.process: subprocess.Popen | None = None
+        self.memory_reserved = 0  # CUDA bytes held by the process, as last reported
+        self.job_id: str | None = None  # job receiving the worker's progress output
+        self._pending: tuple[subprocess.Popen, asyncio.Future] | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def ensure_started(self) -> subprocess.Popen:
+        if self.process and self.process.poll() is None:
+            return self.process
+
+        # Built per spawn so later changes to os.environ (e.g. PATH) carry over
+        env = None
+        if self.gpu_id is not None:
+            env = {**os.environ, "CUDA_VISIBLE_DEVICES": self.gpu_id}
 
         if sys.platform == "win32":
             # creationflags=subprocess.CREATE_NO_WINDOW prevents opening a new console on Windows
             creationflags = subprocess.CREATE_NO_WINDOW
             process = subprocess.Popen(
-                cmd,
+                WORKER_CMD,
+                stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True,
+                env=env,
                 creationflags=creationflags
             )
         else:
+            # Own process group, so a cancel can kill the worker together
+            # with any ffmpeg it has spawned (see kill_process_group)
             process = subprocess.Popen(
-                cmd,
+                WORKER_CMD,
+                stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                text=True
+                text=True,
+                env=env,
+                start_new_session=True
             )
 
+        gpu = f", GPU {self.gpu_id}" if self.gpu_id is not None else ""
+        log.info(f"🔧 Started {self.name.lower()} (pid {process.pid}{gpu})")
+        threading.Thread(target=self._read_stderr, args=(process,), daemon=True).start()
+        threading.Thread(target=self._read_stdout, args=(process,), daemon=True).start()
+        self.process = process
+        return process
+
+    def _read_stderr(self, process: subprocess.Popen):
+        try:
+            # Read whatever is available instead of one char per syscall; tqdm
+            # redraws with \r, so split on both line endings ourselves.
+            decoder = codecs.getincrementaldecoder(process.stderr.encoding)(errors="replace")
+            raw = process.stderr.buffer
+            buffer = ""
+            is_downloading = False
+            last_update = None
+            for chunk in iter(lambda: raw.read1(4096), b""):
+                lines = _STDERR_LINE_RE.split(buffer + decoder.decode(chunk))
+                buffer = lines.pop()
+
+                for line in lines:
+                    line_stripped = line.strip()
+                    if not line_stripped:
+                        continue
+
+                    # Log everything to keep Azure Log stream alive (prevents AjaxError log drop)
+                    log.info(f"[{self.name}] {line_stripped}")
+
+                    job_id = self.job_id
+                    if job_id:
+                        if "Downloading" in line_stripped:
+                            is_downloading = True
+
+                        # tqdm redraws far more often than the numbers change;
+                        # only touch the job when something visible moved.
+                        progress = parse_tqdm_line(line)
+                        if progress and (job_id, is_downloading, progress) != last_update:
+                            last_update = (job_id, is_downloading, progress)
+                            pct, eta_seconds = progress
+                            msg = f"Downloading model... {pct}%" if is_downloading else f"Separating stems... {pct}%"
+                            update_job(job_id, progress=pct, eta_seconds=eta_seconds, message=msg)
+
+                        # If downloading just finished (reached 100%), show loading message
+                        if is_downloading and progress and progress[0] == 100:
+                            is_downloading = False
+                            update_job(job_id, message="Loading AI model into memory (takes 1-2 mins)...", progress=0, eta_seconds=None)
+        except Exception as e:
+            log.error(f"Error reading stderr: {e}")
+
+    def _read_stdout(self, process: subprocess.Popen):
+        try:
+            for line in iter(process.stdout.readline, ''):
+                line = line.strip()
+                if line.startswith(("DONE:", "ERROR:")):
+                    self._post_result(process, line)
+                elif line.startswith("MEM:"):
+                    # Parsed on its own so a malformed line (or library output
+                    # that happens to start with "MEM:") can't end the reader
+                    try:
+                        self.memory_reserved = int(line[4:])
+                    except ValueError:
+                        log.warning(f"[{self.name}] Ignoring malformed memory report: {line}")
+                elif line:
+                    log.info(f"[{self.name}] {line}")
+        except Exception as e:
+            log.error(f"Error reading stdout: {e}")
+
+        # stdout closed: the worker died or was killed by a cancel
+        process.wait()
+        if self.process is process:
+            self.memory_reserved = 0
+        self._post_result(process, None)
+
+    def _post_result(self, process: subprocess.Popen, result: str | None):
+        """Called from the reader thread; hands the answer to the event loop."""
+        if self._loop is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._set_result, process, result)
+        except RuntimeError:
+            pass  # loop closed during shutdown
+
+    def _set_result(self, process: subprocess.Popen, result: str | None):
+        # Ignore answers from a previous process that is no longer serving a job
+        if self._pending and self._pending[0] is process and not self._pending[1].done():
+            self._pending[1].set_result(result)
+
+    async def run_job(self, job_id: str, input_path: str, job_out_dir: str) -> tuple[subprocess.Popen, str | None]:
+        """Sends one job to the worker and waits for its answer.
+
+        Must only be called while the worker is checked out of the pool. Returns the process and its
+        DONE:/ERROR: line, or None if the process exited before answering.
+        """
+        self._loop = asyncio.get_running_loop()
+        process = self.ensure_started()
+        result = self._loop.create_future()
+        self._pending = (process, result)
+        self.job_id = job_id
+
         with processes_lock:
             active_processes[job_id] = process
 
-        def read_stderr():
+        try:
             try:
-                buffer = ""
-                is_downloading = False
-                while True:
-                    char = process.stderr.read(1)
-                    if not char:
-                        break
-                        
-                    if char == '\r' or char == '\n':
-                        if buffer:
-                            line_stripped = buffer.strip()
-                            if line_stripped:
-                                # Log everything to keep Azure Log stream alive (prevents AjaxError log drop)
-                                log.info(f"[Worker] {line_stripped}")
-                                
-                            if "Downloading" in line_stripped:
-                                is_downloading = True
-                                
-                            parse_tqdm_line(buffer, job_id, is_downloading)
-                            
-                            # If downloading just finished (reached 100%), show loading message
-                            if is_downloading and "100%|" in line_stripped:
-                                is_downloading = False
-                                update_job(job_id, message="Loading AI model into memory (takes 1-2 mins)...", progress=0, eta_seconds=None)
-                                
-                            buffer = ""
-                    else:
-                        buffer += char
-            except Exception as e:
-                log.error(f"Error reading stderr: {e}")
-
-        stderr_thread = threading.Thread(target=read_stderr, daemon=True)
-        stderr_thread.start()
-
-        # Read stdout to get the final output or errors
-        stdout_output = []
-        for line in iter(process.stdout.readline, ''):
-            if line:
-                stdout_output.append(line.strip())
-        
-        process.wait()
+                process.stdin.write(json.dumps({"job_id": job_id, "input": input_path, "out_dir": job_out_dir}) + "\n")
+                process.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                # The stdout reader reports the exit once the process is gone
+                log.error(f"Worker pipe closed: {e}")
+            return process, await result
+        finally:
+            self._pending = None
+            self.job_id = None
+            with processes_lock:
+                active_processes.pop(job_id, None)
+
+
+def kill_process_group(process):
+    """Force-kills a worker (or a job's ffmpeg transcode) mid-job.
+
+    Both are started in their own session on POSIX, so this also takes down
+    anything they spawned. Workers hold nothing that needs a graceful shutdown (outputs of a
+    cancelled job are deleted anyway), and PyTorch doesn't act on SIGTERM
+    mid-separation, so there's no point in waiting for one.
+    """
+    if sys.platform == "win32":
+        process.kill()
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass  # already gone
+
+
+class WorkerPool:
+    """A fixed set of long-lived workers, one per concurrent separation.
+
+    Idle workers wait in a queue; a job checks one out for its whole run, so
+    uploads beyond the pool size stay "queued" until a worker frees up.
+    Worker processes are started lazily (or by the warm-up) and keep their
+    model loaded between jobs.
+    """
+
+    def __init__(self, size: int, gpu_ids: list[str]):
+        names = ["Worker"] if size == 1 else [f"Worker {i}" for i in range(size)]
+        self.workers = [
+            SeparationWorker(name, gpu_ids[i % len(gpu_ids)] if gpu_ids else None)
+            for i, name in enumerate(names)
+        ]
+        self._idle: asyncio.Queue[SeparationWorker] = asyncio.Queue()
+        for worker in self.workers:
+            self._idle.put_nowait(worker)
+
+    @asynccontextmanager
+    async def checkout(self):
+        worker = await self._idle.get()
+        try:
+            yield worker
+        finally:
+            self._idle.put_nowait(worker)
+
+    def shutdown(self, timeout: float = 2.0):
+        """Stops every worker process (server shutdown).
+
+        Idle workers exit on their own once stdin is closed. A worker that
+        is mid-job only reads stdin between jobs, so it is killed outright,
+        as is anything that hasn't exited within the timeout.
+        """
+        running = []
+        for worker in self.workers:
+            process = worker.process
+            if not process or process.poll() is not None:
+                continue
+            if worker.job_id:
+                kill_process_group(process)
+            else:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
+            running.append(process)
+
+        deadline = time.time() + timeout
+        for process in running:
+            try:
+                process.wait(max(0.0, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                kill_process_group(process)
+                process.wait()
+
+
+worker_pool = WorkerPool(MAX_CONCURRENT_JOBS, GPU_IDS)
+
+# Strong references to running job tasks so they aren't garbage collected
+_job_tasks: set[asyncio.Task] = set()
+
+
+# htdemucs_6s works on 44.1 kHz stereo; decoding/resampling the upload once
+# here means the worker only ever reads plain PCM.
+TRANSCODE_ARGS = ["-ar", "44100", "-ac", "2", "-c:a", "pcm_s16le", "-f", "wav"]
+
+
+async def transcode_to_wav(job_id: str, input_path: str) -> str:
+    """Converts the upload to 44.1 kHz stereo 16-bit WAV for the worker.
+
+    The WAV keeps the upload's base name (in a subdirectory, so a .wav upload
+    isn't overwritten) because the stem file names are derived from it.
+    Returns input_path unchanged if ffmpeg isn't available or fails. The
+    ffmpeg process is registered in active_transcodes so a cancel can kill it.
+    """
+    wav_dir = os.path.join(os.path.dirname(input_path), "wav")
+    wav_path = os.path.join(wav_dir, os.path.splitext(os.path.basename(input_path))[0] + ".wav")
+    cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", input_path, *TRANSCODE_ARGS, wav_path]
+    if sys.platform == "win32":
+        spawn_kwargs = {"creationflags": subprocess.CREATE_NO_WINDOW}
+    else:
+        # Own process group, so a cancel kills it cleanly (see kill_process_group)
+        spawn_kwargs = {"start_new_session": True}
+    try:
+        os.mkdir(wav_dir)
+        try:
+            # Awaited on the event loop, so the transcode doesn't tie up a thread
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                **spawn_kwargs,
+            )
+            communicate = proc.communicate
+        except NotImplementedError:
+            # uvicorn --reload runs a selector loop on Windows, which can't spawn subprocesses
+            proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, **spawn_kwargs)
+            communicate = functools.partial(asyncio.to_thread, proc.communicate)
 
-        # Cleanup process tracking
         with processes_lock:
-            if job_id in active_processes:
-                del active_processes[job_id]
+            active_transcodes[job_id] = proc
+        try:
+            _, stderr = await communicate()
+        finally:
+            with processes_lock:
+                active_transcodes.pop(job_id, None)
+        returncode = proc.returncode
+    except OSError as e:
+        log.warning(f"⚠️  WAV transcode failed, passing the upload as-is: {e}")
+        return input_path
+
+    job = get_job(job_id)
+    if job and job.status == "cancelled":
+        return input_path  # killed by cancel_job; run_separation cleans up
+    if returncode != 0:
+        log.warning(f"⚠️  WAV transcode failed, passing the upload as-is: {stderr.decode(errors='replace').strip()}")
+        return input_path
+    return wav_path
+
+
+async def run_separation(job_id: str, input_path: str, job_out_dir: str, job_temp_dir: str):
+    """Waits for a free worker from the pool and runs one separation on it."""
+    try:
+        async with worker_pool.checkout() as worker:
+            # Cancelled while still in the queue
+            job = get_job(job_id)
+            if not job or job.status == "cancelled":
+                cleanup_job(job_id, job.files if job else None)
+                return
+
+            # Transcoded only once a worker is free, so ffmpeg runs are bounded
+            # by the pool size and queued jobs don't hold a full-size WAV
+            update_job(job_id, status="processing", progress=0, message="Preparing audio...")
+            upload_path = input_path
+            input_path = await transcode_to_wav(job_id, upload_path)
+            if input_path != upload_path:
+                update_job(job_id, files=(upload_path, input_path))
+
+            # Cancelled during the transcode
+            job = get_job(job_id)
+            if not job or job.status == "cancelled":
+                cleanup_job(job_id, job.files if job else None)
+                return
+
+            update_job(job_id, message="Initializing worker...")
+            start_time = time.time()
+            process, result = await worker.run_job(job_id, input_path, job_out_dir)
 
         # Check if job was cancelled
         job = get_job(job_id)
-        if job and job.get("status") == "cancelled":
-            cleanup_files(job_temp_dir)
-            cleanup_files(job_out_dir)
-            release_gpu_memory()
+        if job and job.status == "cancelled":
+            cleanup_job(job_id, job.files)
             return
 
-        if process.returncode != 0:
-            error_msg = "Unknown error occurred"
-            for out in stdout_output:
-                if out.startswith("ERROR:"):
-                    error_msg = out.split("ERROR:", 1)[1]
-                    break
-            raise Exception(f"Worker exited with code {process.returncode}: {error_msg}")
+        if result is None:
+            raise Exception(f"Worker exited with code {process.returncode}: Unknown error occurred")
+
+        if result.startswith("ERROR:"):
+            raise Exception(f"Worker failed: {result.split('ERROR:', 1)[1]}")
 
         elapsed = time.time() - start_time
-        
-        # Parse standard output for DONE:file1.mp3,file2.mp3
+
+        # Parse DONE:file1.mp3,file2.mp3
         output_files = []
-        for out in stdout_output:
-            if out.startswith("DONE:"):
-                files_str = out.split("DONE:", 1)[1]
-                if files_str:
-                    output_files = files_str.split(",")
-                break
+        files_str = result.split("DONE:", 1)[1]
+        if files_str:
+            output_files = files_str.split(",")
 
         log.info(f"✅ Separation complete in {elapsed:.1f}s: {output_files}")
 
-        # Release GPU memory
-        release_gpu_memory()
-
         # Build stems dict
         stems = {}
-        stem_keywords = {
-            "vocals": "Vocals",
-            "drums": "Drums",
-            "bass": "Bass",
-            "guitar": "Guitar",
-            "piano": "Piano",
-            "other": "Other",
-        }
-
+        stem_files = []
         for stem_path in output_files:
             stem_basename = os.path.basename(stem_path)
-            stem_lower = stem_basename.lower()
-            for keyword, label in stem_keywords.items():
-                if keyword in stem_lower:
-                    stems[label] = f"/stems/{job_id}/{stem_basename}"
-                    break
+            stem_files.append(os.path.join(job_out_dir, stem_basename))
+            label = label_for(stem_basename)
+            if label:
+                stems[label] = f"/stems/{job_id}/{stem_basename}"
 
         # Fallback: scan output directory
         if not stems:
             log.warning("Scanning output dir for stems")
-            for f in os.listdir(job_out_dir):
-                if f.endswith(".mp3"):
-                    stem_lower = f.lower()
-                    for keyword, label in stem_keywords.items():
-                        if keyword in stem_lower:
-                             stems[label] = f"/stems/{job_id}/{f}"
-                             break
-                    else:
-                        stems[f] = f"/stems/{job_id}/{f}"
+            stem_files = []
+            with os.scandir(job_out_dir) as entries:
+                for entry in entries:
+                    stem_files.append(entry.path)
+                    if entry.name.endswith(".mp3"):
+                        stems[label_for(entry.name) or entry.name] = f"/stems/{job_id}/{entry.name}"
 
         # Cleanup temp
         cleanup_files(job_temp_dir)
@@ -407,54 +875,160 @@ def run_separation(job_id: str, input_path: str, job_out_dir: str, job_temp_dir:
             processing_time=round(elapsed, 1),
             device_used=DEVICE_TYPE,
             eta_seconds=0,
+            # The temp dir is gone; from here on the job's files are its stems
+            files=tuple(stem_files),
         )
+        schedule_expiry(job_id, time.time())
 
     except Exception as e:
         import traceback
         traceback.print_exc()
         cleanup_files(job_temp_dir)
         cleanup_files(job_out_dir)
-        release_gpu_memory()
-        
+
         # Only set error if not already cancelled
         job = get_job(job_id)
-        if job and job.get("status") != "cancelled":
+        if job and job.status != "cancelled":
             update_job(
                 job_id,
                 status="error",
                 progress=0,
                 message=str(e),
             )
+            schedule_expiry(job_id, time.time())
 
 
 # ============================================================
 # Cleanup
 # ============================================================
 def cleanup_files(folder_path: str):
-    if os.path.exists(folder_path):
-        shutil.rmtree(folder_path)
+    # rmtree already tolerates a missing dir; no separate exists() check
+    shutil.rmtree(folder_path, ignore_errors=True)
+
+
+def unlink_job_files(job_id: str, files: tuple[str, ...]):
+    """Unlinks the recorded files of a job, skipping any that resolve outside its dirs."""
+    roots = (os.path.join(TEMP_ROOT, job_id) + os.sep, os.path.join(STEMS_ROOT, job_id) + os.sep)
+    for path in files:
+        if not os.path.realpath(path).startswith(roots):
+            log.warning(f"Not removing {path}: outside the dirs of job {job_id}")
+            continue
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def cleanup_job(job_id: str, files: tuple[str, ...] | None):
+    """Removes a job's temp and output dirs.
+
+    Job dirs are (nearly) flat, so unlinking the files we know about and
+    rmdir-ing the dirs is cheaper than rmtree. rmtree is only used when there
+    is no file list, or something we didn't know about is left behind (e.g.
+    a stem the worker was writing when it was killed). Only the job's own
+    dirs are ever removed, never a dir derived from a file entry.
+    """
+    job_temp_dir = os.path.join(TEMP_DIR, job_id)
+    job_dirs = [job_temp_dir, os.path.join(OUTPUT_DIR, job_id)]
+    if not files:
+        for folder_path in job_dirs:
+            cleanup_files(folder_path)
+        return
+
+    unlink_job_files(job_id, files)
+    # The transcode's wav/ subdir first, so the temp dir is empty before its rmdir
+    for folder_path in [os.path.join(job_temp_dir, "wav"), *job_dirs]:
+        try:
+            os.rmdir(folder_path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            cleanup_files(folder_path)
+
+
+# Finished jobs as (expires_at, job_id). The cleanup thread sleeps until the
+# earliest entry is due instead of polling the job table and OUTPUT_DIR.
+_expiry_heap: list[tuple[float, str]] = []
+_expiry_cv = threading.Condition()
+
+# Expired job dirs are removed in parallel so a backlog doesn't stall the loop
+_cleanup_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cleanup")
+
+
+def schedule_expiry(job_id: str, finished_at: float):
+    """Queues a job's stems for removal RETENTION_SECONDS after it finished.
+
+    Counted from completion, not upload, so time spent waiting in the queue
+    doesn't eat into how long the stems stay available.
+    """
+    with _expiry_cv:
+        heapq.heappush(_expiry_heap, (finished_at + RETENTION_SECONDS, job_id))
+        _expiry_cv.notify()
+
+
+def schedule_existing_dirs():
+    """Puts stem dirs left over from a previous run (crash/restart) on the expiry heap."""
+    with os.scandir(OUTPUT_DIR) as entries:
+        for e in entries:
+            if e.is_dir(follow_symlinks=False):
+                schedule_expiry(e.name, e.stat(follow_symlinks=False).st_mtime)
+
+
+def remove_expired_dir(job_id: str, files: tuple[str, ...] | None) -> bool:
+    """Returns True if the job's stems dir was removed (the caller logs one summary per pass)."""
+    dir_path = os.path.join(OUTPUT_DIR, job_id)
+    try:
+        if files:
+            # Stems recorded at completion: unlink them and rmdir, no walk
+            unlink_job_files(job_id, files)
+            try:
+                os.rmdir(dir_path)
+                return True
+            except FileNotFoundError:
+                return False  # failed jobs remove their own output dir
+            except OSError:
+                pass  # something we didn't record is still in there
+        shutil.rmtree(dir_path)
+        return True
+    except FileNotFoundError:
+        pass  # failed jobs remove their own output dir
+    except OSError as e:
+        log.error(f"Cleanup error for {dir_path}: {e}")
+    return False
 
 
 def background_cleanup_thread():
+    try:
+        schedule_existing_dirs()
+    except OSError as e:
+        log.error(f"Cleanup error: {e}")
+
     while True:
         try:
-            now = time.time()
-            # Clean old stems
-            for d in os.listdir(OUTPUT_DIR):
-                dir_path = os.path.join(OUTPUT_DIR, d)
-                if os.path.isdir(dir_path):
-                    if os.stat(dir_path).st_mtime < now - RETENTION_SECONDS:
-                        shutil.rmtree(dir_path)
-                        log.info(f"🧹 Cleaned up expired stems: {d}")
-            # Clean old job status entries
-            with jobs_lock:
-                for jid in list(jobs.keys()):
-                    j = jobs[jid]
-                    if j.get("status") in ("complete", "error"):
-                        started = j.get("started_at", 0)
-                        if started and now - started > RETENTION_SECONDS:
-                            del jobs[jid]
-            time.sleep(600 if not CLOUD_MODE else 300)
+            with _expiry_cv:
+                # Sleep until the earliest job expires; schedule_expiry() wakes
+                # us early if a sooner one is added
+                while not _expiry_heap or _expiry_heap[0][0] > time.time():
+                    _expiry_cv.wait(_expiry_heap[0][0] - time.time() if _expiry_heap else None)
+                now = time.time()
+                due = []
+                while _expiry_heap and _expiry_heap[0][0] <= now:
+                    due.append(heapq.heappop(_expiry_heap)[1])
+
+            # expire_job() leaves anything that isn't finished in the table
+            expired, expired_files = [], []
+            for jid in due:
+                remove, files = expire_job(jid)
+                if remove:
+                    expired.append(jid)
+                    expired_files.append(files)
+            cleaned = [
+                jid for jid, removed in zip(expired, _cleanup_pool.map(remove_expired_dir, expired, expired_files))
+                if removed
+            ]
+            if cleaned:
+                more = f" (+{len(cleaned) - 5} more)" if len(cleaned) > 5 else ""
+                log.info(f"🧹 Cleaned up {len(cleaned)} expired stem dir(s): {', '.join(cleaned[:5])}{more}")
         except Exception as e:
             log.error(f"Cleanup error: {e}")
             time.sleep(60)
@@ -463,22 +1037,6 @@ def background_cleanup_thread():
 threading.Thread(target=background_cleanup_thread, daemon=True).start()
 
 
-# ============================================================
-# GPU Memory Management
-# ============================================================
-def release_gpu_memory():
-    if DEVICE_TYPE == "cuda":
-        torch.cuda.empty_cache()
-        torch.cuda.synchronize()
-        log.info("🧹 CUDA memory cache cleared")
-    elif DEVICE_TYPE == "mps":
-        try:
-            torch.mps.empty_cache()
-            log.info("🧹 MPS memory cache cleared")
-        except AttributeError:
-            pass
-
-
 # ============================================================
 # Routes
 # ============================================================
@@ -495,85 +1053,139 @@ async def health():
         gpu_info["vram_gb"] = round(GPU_VRAM_GB, 1)
     if DEVICE_TYPE == "cuda":
         gpu_info["cuda_version"] = torch.version.cuda
+        # As reported by the workers after each job. Never queried from the GPU
+        # here: this endpoint is polled and must not stall it.
+        gpu_info["vram_reserved_gb"] = round(sum(w.memory_reserved for w in worker_pool.workers) / 1024**3, 2)
     return gpu_info
 
 
+def save_upload(src: BinaryIO, dst_path: str):
+    """Copies a spooled upload to dst_path.
+
+    When the upload is backed by a real file, Linux copies it in-kernel with
+    sendfile() and the data never passes through Python. (fileno() rolls a
+    spool that is still in memory over to disk first; those are under 1 MiB.)
+    Anything without a usable file descriptor is copied in 1 MiB blocks.
+    """
+    src.seek(0)
+    with open(dst_path, "wb") as dst:
+        in_fd = None
+        if sys.platform == "linux":
+            try:
+                in_fd = src.fileno()
+            except (io.UnsupportedOperation, OSError):
+                pass
+        if in_fd is not None:
+            src.flush()
+            out_fd = dst.fileno()
+            size = os.fstat(in_fd).st_size
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(out_fd, in_fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        else:
+            shutil.copyfileobj(src, dst, 1 << 20)
+
+
 @app.post("/separate/")
 async def separate_audio(file: UploadFile = File(...)):
     """Upload audio and start async separation. Returns job_id for status polling."""
 
     if not file.filename:
-        return JSONResponse({"error": "No file uploaded"}, status_code=400)
+        return ORJSONResponse({"error": "No file uploaded"}, status_code=400)
 
-    # Read file and check size
-    contents = await file.read()
-    file_size_mb = len(contents) / (1024 * 1024)
-    if file_size_mb > MAX_FILE_SIZE_MB:
-        return JSONResponse(
-            {"error": f"File too large ({file_size_mb:.1f} MB). Max: {MAX_FILE_SIZE_MB} MB"},
-            status_code=413,
-        )
+    # The client-supplied name is only used for its last component (browsers
+    # may send a Windows path), so it can't point outside the job's temp dir
+    filename = os.path.basename(file.filename.replace("\\", "/"))
+    if filename in ("", ".", ".."):
+        return ORJSONResponse({"error": "Invalid file name"}, status_code=400)
 
-    job_id = str(uuid.uuid4())
+    job_id = new_job_id()
     job_temp_dir = os.path.join(TEMP_DIR, job_id)
     job_out_dir = os.path.join(OUTPUT_DIR, job_id)
 
-    os.makedirs(job_temp_dir, exist_ok=True)
-    os.makedirs(job_out_dir, exist_ok=True)
+    # Fresh random ID, and TEMP_DIR/OUTPUT_DIR exist from startup: a plain mkdir is enough
+    os.mkdir(job_temp_dir)
+    os.mkdir(job_out_dir)
 
-    input_path = os.path.join(job_temp_dir, file.filename)
-    with open(input_path, "wb") as buffer:
-        buffer.write(contents)
+    input_path = os.path.join(job_temp_dir, filename)
+    max_bytes = MAX_FILE_SIZE_MB * 1024 * 1024
+    # The multipart parser has already spooled the whole upload and counted
+    # it; seeking to the end is only a fallback for a missing size
+    size = file.size if file.size is not None else file.file.seek(0, os.SEEK_END)
 
-    # Initialize job tracking
-    with jobs_lock:
-        jobs[job_id] = {
-            "status": "uploading",
-            "progress": 0,
-            "eta_seconds": None,
-            "message": "Upload received, starting separation...",
-            "stems": None,
-            "started_at": time.time(),
-            "processing_time": None,
-            "device_used": DEVICE_TYPE,
-        }
+    if size > max_bytes:
+        cleanup_files(job_temp_dir)
+        cleanup_files(job_out_dir)
+        file_size_mb = size / (1024 * 1024)
+        return ORJSONResponse(
+            {"error": f"File too large ({file_size_mb:.1f} MB). Max: {MAX_FILE_SIZE_MB} MB"},
+            status_code=413,
+        )
+
+    # Written under a temporary name and renamed once complete, so a killed
+    # upload never leaves a truncated file at input_path
+    part_path = input_path + ".part"
+    await asyncio.to_thread(save_upload, file.file, part_path)
+    os.replace(part_path, input_path)
+    file_size_mb = size / (1024 * 1024)
 
-    # Start separation in a background thread
-    log.info(f"🎵 Starting separation: {file.filename} ({file_size_mb:.1f} MB) on {DEVICE_TYPE.upper()}")
-    thread = threading.Thread(
-        target=run_separation,
-        args=(job_id, input_path, job_out_dir, job_temp_dir),
-        daemon=True,
-    )
-    thread.start()
+    # Initialize job tracking
+    add_job(job_id, Job(
+        status="queued",
+        message="Upload received, waiting in queue...",
+        started_at=time.time(),
+        device_used=DEVICE_TYPE,
+        files=(input_path,),
+    ))
+
+    # Queue the separation; it waits for a free worker in worker_pool
+    log.info(f"🎵 Queued separation: {filename} ({file_size_mb:.1f} MB) on {DEVICE_TYPE.upper()}")
+    task = asyncio.create_task(run_separation(job_id, input_path, job_out_dir, job_temp_dir))
+    _job_tasks.add(task)
+    task.add_done_callback(_job_tasks.discard)
 
     return {
         "job_id": job_id,
-        "message": "Separation started",
-        "status": "processing",
+        "message": "Separation queued",
+        "status": "queued",
     }
 
 
+@app.api_route("/stems/{job_id}/{name}", methods=["GET", "HEAD"])
+async def serve_stem(job_id: str, name: str):
+    """Serves a separated stem. FileResponse streams from disk and supports Range requests."""
+    if not is_valid_job_id(job_id):
+        return ORJSONResponse({"error": "Stem not found"}, status_code=404)
+    path = os.path.realpath(os.path.join(STEMS_ROOT, job_id, name))
+    if not path.startswith(STEMS_ROOT + os.sep) or not os.path.isfile(path):
+        return ORJSONResponse({"error": "Stem not found"}, status_code=404)
+    return FileResponse(path, media_type="audio/mpeg")
+
+
 @app.get("/status/{job_id}")
 async def get_status(job_id: str):
     """Poll this endpoint for real-time separation progress."""
     job = get_job(job_id)
     if not job:
-        return JSONResponse({"error": "Job not found"}, status_code=404)
-    return job
+        return ORJSONResponse({"error": "Job not found"}, status_code=404)
+    status = asdict(job)
+    del status["files"]
+    return status
 
 
 @app.get("/jobs")
 async def list_jobs():
     """List all active jobs. Used by frontend to reconnect after page reload."""
-    with jobs_lock:
-        active = {}
-        for jid, j in jobs.items():
-            active[jid] = {
-                "status": j.get("status"),
-                "progress": j.get("progress", 0),
-                "message": j.get("message", ""),
-            }
+    active = {}
+    for jid, j in all_jobs():
+        active[jid] = {
+            "status": j.status,
+            "progress": j.progress,
+            "message": j.message,
+        }
     return {"jobs": active}
 
 
@@ -582,35 +1194,40 @@ async def cancel_job(job_id: str):
     """Instantly terminate a running separation job process by ID."""
     job = get_job(job_id)
     if not job:
-        return JSONResponse({"error": "Job not found"}, status_code=404)
+        return ORJSONResponse({"error": "Job not found"}, status_code=404)
         
-    if job.get("status") not in ("uploading", "processing"):
-        return JSONResponse({"error": "Job is not active"}, status_code=400)
+    if job.status not in ("queued", "processing"):
+        return ORJSONResponse({"error": "Job is not active"}, status_code=400)
     
     log.info(f"🛑 Cancelling job {job_id}")
     
     # Mark as cancelled immediately so the frontend knows
     update_job(job_id, status="cancelled", message="Job cancelled by user")
     
+    # Only the pop happens under the lock; the kill and wait below don't hold
+    # up other cancels or workers registering their jobs. (run_job's own pop
+    # on exit is then a no-op.)
     with processes_lock:
-        process = active_processes.get(job_id)
-        if process:
-            log.info(f"🔪 Terminating subprocess for {job_id}")
-            process.terminate()
-            # On windows process.kill() or taskkill might be needed for forceful abort,
-            # but terminate() usually suffices since it's just a PyTorch script.
-            try:
-                process.wait(timeout=3)
-            except subprocess.TimeoutExpired:
-                process.kill()
-            del active_processes[job_id]
-            
-    # Clean up files manually since the thread probably died immediately
-    job_temp_dir = os.path.join(TEMP_DIR, job_id)
-    job_out_dir = os.path.join(OUTPUT_DIR, job_id)
-    cleanup_files(job_temp_dir)
-    cleanup_files(job_out_dir)
-    release_gpu_memory()
-    
+        process = active_processes.pop(job_id, None)
+        transcode = active_transcodes.pop(job_id, None)
+
+    if transcode:
+        log.info(f"🔪 Killing ffmpeg transcode for {job_id}")
+        kill_process_group(transcode)
+
+    if process:
+        log.info(f"🔪 Killing worker for {job_id}")
+        kill_process_group(process)
+        # Reap it before deleting the job's files, so nothing is still writing
+        try:
+            await asyncio.to_thread(process.wait, 1)
+        except subprocess.TimeoutExpired:
+            log.warning(f"Worker pid {process.pid} still running after kill")
+
+    # Clean up files manually since the job task may not have noticed yet.
+    # Re-read the job: the transcode may have added files since the check above.
+    job = get_job(job_id)
+    cleanup_job(job_id, job.files if job else None)
+
     return {"message": "Job cancelled"}
 
@@ -0,0 +1,62 @@
+import os
+import shutil
+import logging
+
+log = logging.getLogger("unweave")
+
+# Linux only: a tmpfs mount, so the copied model files live in RAM and every
+# worker process loads them without touching the disk.
+SHM_ROOT = "/dev/shm"
+SHM_MODELS_DIR = os.path.join(SHM_ROOT, "unweave_models")
+SHM_ENABLED = os.getenv("MODELS_IN_SHM", "1") == "1"
+
+# Leave most of /dev/shm for everything else (Docker only gives it 64 MB)
+SHM_MAX_FRACTION = 0.5
+
+
+def mirror_models(models_dir: str, model_file: str) -> str:
+    """
+    Copies the downloaded model files into /dev/shm and returns the directory
+    workers should load from. Falls back to models_dir when /dev/shm is
+    missing or too small, or model_file hasn't been downloaded yet: a worker
+    would otherwise download it into the mirror, where it is lost on reboot.
+    The first run downloads straight into models_dir; later starts pick the
+    files up.
+    """
+    if not SHM_ENABLED or not os.path.isdir(SHM_ROOT):
+        return models_dir
+    if not os.path.isfile(os.path.join(models_dir, model_file)):
+        log.info(f"📦 {model_file} not downloaded yet, loading from {models_dir}")
+        return models_dir
+
+    try:
+        with os.scandir(models_dir) as entries:
+            files = [(e.name, e.path, e.stat()) for e in entries if e.is_file()]
+
+        # Files copied by a previous start are reused if unchanged
+        stale = []
+        for name, path, st in files:
+            dst = os.path.join(SHM_MODELS_DIR, name)
+            try:
+                dst_st = os.stat(dst)
+                if dst_st.st_size == st.st_size and dst_st.st_mtime == st.st_mtime:
+                    continue
+            except FileNotFoundError:
+                pass
+            stale.append((path, dst, st.st_size))
+
+        needed = sum(size for _, _, size in stale)
+        if needed > shutil.disk_usage(SHM_ROOT).free * SHM_MAX_FRACTION:
+            log.info(f"📦 Not enough room in {SHM_ROOT} for models ({needed / (1024 * 1024):.0f} MB), loading from disk")
+            return models_dir
+
+        os.makedirs(SHM_MODELS_DIR, exist_ok=True)
+        for path, dst, _ in stale:
+            # copy2 keeps the mtime, which is what the freshness check compares
+            shutil.copy2(path, dst)
+    except OSError as e:
+        log.warning(f"⚠️  Could not copy models to {SHM_ROOT}, loading from disk: {e}")
+        return models_dir
+
+    log.info(f"📦 Loading models from {SHM_MODELS_DIR}")
+    return SHM_MODELS_DIR
@@ -0,0 +1,75 @@
+import os
+import time
+import wave
+import shutil
+import asyncio
+import logging
+import tempfile
+
+log = logging.getLogger("unweave")
+
+WARMUP_ENABLED = os.getenv("WARMUP", "1") == "1"
+
+
+def write_silence(path: str, seconds: float = 1.0, sample_rate: int = 44100):
+    """Writes a 16-bit stereo WAV of silence."""
+    frames = int(seconds * sample_rate)
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(b"\x00" * frames * 2 * 2)
+
+
+async def run_warmup(worker):
+    """Starts the worker and pushes one second of silence through the model.
+
+    This moves the model download/load and the first-run CUDA kernel setup
+    out of the first user request. The worker logs the model load time
+    itself; the time logged here is the whole one-time cost.
+    """
+    tmpdir = tempfile.mkdtemp(prefix="unweave_warmup_")
+    try:
+        input_path = os.path.join(tmpdir, "warmup.wav")
+        write_silence(input_path)
+
+        start = time.time()
+        _, result = await worker.run_job("warmup", input_path, tmpdir)
+
+        if result and result.startswith("DONE:"):
+            log.info(f"🔥 {worker.name} warm-up complete in {time.time() - start:.1f}s (model load + first separation)")
+        else:
+            log.warning(f"⚠️  {worker.name} warm-up failed: {result or 'worker exited'}")
+    except Exception as e:
+        log.warning(f"⚠️  {worker.name} warm-up failed: {e}")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+async def warm_pool(pool):
+    """Warms every worker in the pool.
+
+    One worker is warmed on its own first: on a first run it downloads the
+    model, and the others would otherwise all download it into the same
+    models dir at once. The rest are then warmed concurrently.
+    """
+    async def warm_one():
+        async with pool.checkout() as worker:
+            await run_warmup(worker)
+
+    if not pool.workers:
+        return
+    await warm_one()
+    await asyncio.gather(*(warm_one() for _ in pool.workers[1:]))
+
+
+_warmup_task: asyncio.Task | None = None
+
+
+async def warmup(pool):
+    """FastAPI startup hook. Runs the warm-up in the background so /health is served right away."""
+    global _warmup_task
+    if not WARMUP_ENABLED:
+        return
+    log.info("🔥 Warming up separation model...")
+    _warmup_task = asyncio.create_task(warm_pool(pool))
@@ -1,69 +1,171 @@
 import os
 import sys
 import argparse
+import json
+import threading
 import time
+from typing import TYPE_CHECKING
 
-# FFmpeg PATH Fix (Windows)
+from ffmpeg_path import ensure_ffmpeg_on_path
+
+# FFmpeg PATH Fix (Windows). main.py normally resolves this already and passes
+# UNWEAVE_FFMPEG_OK down, in which case this is a no-op.
 if sys.platform == "win32":
-    try:
-        import subprocess as _sp
-        _sp.check_output(["ffmpeg", "-version"], stderr=_sp.DEVNULL)
-    except FileNotFoundError:
-        _ffmpeg_search_dirs = [
-            os.path.join(os.environ.get("LOCALAPPDATA", ""), "Microsoft", "WinGet", "Links"),
-            os.path.join(os.environ.get("LOCALAPPDATA", ""), "Microsoft", "WinGet", "Packages"),
-            os.path.join(os.environ.get("ProgramFiles", ""), "ffmpeg", "bin"),
-            os.path.join(os.environ.get("ProgramFiles(x86)", ""), "ffmpeg", "bin"),
-        ]
-        for _dir in _ffmpeg_search_dirs:
-            if os.path.isdir(_dir) and any(f.lower().startswith("ffmpeg") for f in os.listdir(_dir)):
-                os.environ["PATH"] = _dir + os.pathsep + os.environ.get("PATH", "")
-                print(f"worker: Added ffmpeg to PATH from: {_dir}", file=sys.stderr)
-                break
-
-from audio_separator.separator import Separator
+    _ffmpeg_dir = ensure_ffmpeg_on_path()
+    if _ffmpeg_dir:
+        print(f"worker: Added ffmpeg to PATH from: {_ffmpeg_dir}", file=sys.stderr)
+
+import torch
+
+# Imported in get_separator(), after run_worker() has set the CPU thread limits
+if TYPE_CHECKING:
+    from audio_separator.separator import Separator
+
+MODEL_FILE = "htdemucs_6s.yaml"
+
+# CUDA/MPS are picked up by audio_separator automatically; only DirectML is opt-in.
+SEPARATOR_BASE_KWARGS = {
+    "output_format": "mp3",
+    "log_level": 10,  # logging.DEBUG to ensure we keep Azure Log Stream active
+}
+
+# ============================================================
+# Model Cache
+# ============================================================
+# The worker is long-lived: main.py keeps it running and feeds it one job per
+# stdin line, so the model is loaded once and reused for every job after that.
+_separator_cache: dict[tuple, "Separator"] = {}
+_separate_locks: dict[tuple, threading.Lock] = {}
+_separator_lock = threading.Lock()
+
+
+def get_separator(device_type: str, model_file: str, models_dir: str) -> "Separator":
+    """Returns the loaded Separator for (device_type, model_file), loading it on first use."""
+    key = (device_type, model_file)
+    with _separator_lock:
+        separator = _separator_cache.get(key)
+        if separator is None:
+            from audio_separator.separator import Separator
+
+            print("worker: Loading model...", file=sys.stderr)
+            load_start = time.time()
+
+            separator_kwargs = {**SEPARATOR_BASE_KWARGS, "model_file_dir": models_dir}
+            # Only passed when set: older audio_separator releases don't know it
+            if device_type == "directml":
+                separator_kwargs["use_directml"] = True
+
+            separator = Separator(**separator_kwargs)
+            separator.load_model(model_filename=model_file)
+
+            _separator_cache[key] = separator
+            _separate_locks[key] = threading.Lock()
+            print(f"worker: Model loaded in {time.time() - load_start:.1f}s", file=sys.stderr)
+        return separator
+
+
+def separate(device_type: str, model_file: str, models_dir: str, input_path: str, out_dir: str) -> list[str]:
+    """Runs one separation on the cached model, writing stems to out_dir."""
+    key = (device_type, model_file)
+    separator = get_separator(device_type, model_file, models_dir)
+
+    # Separator instances are not thread-safe, and the output dir is captured
+    # on the loaded model instance, so repoint it per job under the lock.
+    with _separate_locks[key]:
+        separator.output_dir = out_dir
+        separator.model_instance.output_dir = out_dir
+        output_files = separator.separate(input_path)
+        release_gpu_memory(device_type)
+        return output_files
+
+
+# ============================================================
+# GPU Memory Management
+# ============================================================
+# Fraction of VRAM the worker may keep cached between jobs
+CUDA_CACHE_LIMIT = 0.8
+
+
+def release_gpu_memory(device_type: str):
+    if device_type == "cuda":
+        # Cached blocks normally stay with the caching allocator for the next
+        # job; expandable segments (PYTORCH_CUDA_ALLOC_CONF, set by main.py)
+        # keep them from fragmenting. No private MemPool: PyTorch doesn't use
+        # expandable segments for those. Only hand the cache back once it
+        # holds most of the card, so other processes on the GPU aren't starved.
+        device = torch.cuda.current_device()
+        total = torch.cuda.get_device_properties(device).total_memory
+        if torch.cuda.memory_reserved(device) > CUDA_CACHE_LIMIT * total:
+            # No torch.cuda.synchronize() here: the caching allocator only
+            # frees blocks whose stream work has completed, and a device-wide
+            # sync would stall every stream on the card.
+            with torch.cuda.device(device):
+                torch.cuda.empty_cache()
+            print("worker: CUDA memory cache cleared", file=sys.stderr)
+    elif device_type == "mps":
+        try:
+            torch.mps.empty_cache()
+            print("worker: MPS memory cache cleared", file=sys.stderr)
+        except AttributeError:
+            pass
+
+
+def report_memory(device_type: str):
+    """Tells main.py how much VRAM this worker holds (shown by /health).
+
+    memory_reserved() is a counter kept by the caching allocator, so this
+    never waits on the GPU.
+    """
+    if device_type == "cuda":
+        print(f"MEM:{torch.cuda.memory_reserved()}", file=sys.stdout, flush=True)
+
 
 def run_worker():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--job_id", required=True)
-    parser.add_argument("--input", required=True)
-    parser.add_argument("--out_dir", required=True)
     parser.add_argument("--device_type", required=True)
     parser.add_argument("--models_dir", required=True)
     args = parser.parse_args()
 
-    print("worker: Loading model...", file=sys.stderr)
-    
     # Limit PyTorch CPU threads to avoid severe contention on low-resource environments (like Azure Container Apps)
-    # which can cause the process to hang at "0% / Calculating".
-    import torch
+    # which can cause the process to hang at "0% / Calculating". main.py sets OMP_NUM_THREADS to match.
+    # Done before audio_separator is imported: set_num_interop_threads() raises
+    # once any inter-op parallel work has started.
     if args.device_type == "cpu":
-        torch.set_num_threads(2)
+        torch.set_num_threads(int(os.getenv("TORCH_NUM_THREADS", "2")))
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError as e:
+            print(f"worker: Could not limit inter-op threads: {e}", file=sys.stderr)
+
+    get_separator(args.device_type, MODEL_FILE, args.models_dir)
+    report_memory(args.device_type)
 
-    separator_kwargs = {
-        "output_dir": args.out_dir,
-        "output_format": "mp3",
-        "model_file_dir": args.models_dir,
-        "log_level": 10,  # logging.DEBUG to ensure we keep Azure Log Stream active
-    }
+    # One JSON job per line: {"job_id": ..., "input": ..., "out_dir": ...}
+    # Exits when the parent closes stdin.
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
 
-    if args.device_type == "directml":
-        separator_kwargs["use_directml"] = True
+        try:
+            job = json.loads(line)
+            print(f"worker: Separating stems for {job['job_id']}...", file=sys.stderr)
+            # The Separator class natively prints tqdm to stderr because of our logger config or its own.
+            # We don't intercept it here; let it naturally stream to our parent process (main.py) which reads stderr.
+            separate_start = time.time()
+            output_files = separate(args.device_type, MODEL_FILE, args.models_dir, job["input"], job["out_dir"])
+            print(f"worker: Separated in {time.time() - separate_start:.1f}s", file=sys.stderr)
+            report_memory(args.device_type)
 
-    separator = Separator(**separator_kwargs)
-    separator.load_model(model_filename="htdemucs_6s.yaml")
+            # We output the completed files to STDOUT so the parent can parse them
+            print(f"DONE:{','.join(output_files)}", file=sys.stdout, flush=True)
+        except Exception as e:
+            print(f"ERROR:{str(e)}", file=sys.stdout, flush=True)
 
-    print("worker: Separating stems...", file=sys.stderr)
-    # The Separator class natively prints tqdm to stderr because of our logger config or its own.
-    # We don't intercept it here; let it naturally stream to our parent process (main.py) which reads stderr.
-    output_files = separator.separate(args.input)
-    
-    # We output the completed files to STDOUT so the parent can parse them
-    print(f"DONE:{','.join(output_files)}", file=sys.stdout)
 
 if __name__ == "__main__":
     try:
         run_worker()
     except Exception as e:
-        print(f"ERROR:{str(e)}", file=sys.stdout)
+        print(f"ERROR:{str(e)}", file=sys.stdout, flush=True)
         sys.exit(1)
@@ -154,7 +154,7 @@ function AppContent() {
         const res = await axios.get<{ jobs: Record<string, { status: string; progress: number }> }>('/api/jobs');
         const serverJobs = res.data.jobs;
         const activeIds = Object.entries(serverJobs)
-          .filter(([, j]) => j.status === 'processing' || j.status === 'uploading')
+          .filter(([, j]) => j.status === 'queued' || j.status === 'processing' || j.status === 'uploading')
           .sort(([, a], [, b]) => b.progress - a.progress); // pick the furthest along
 
         if (activeIds.length > 0) {